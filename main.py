@@ -1,128 +1,262 @@
+import asyncio
 import os
-from fastapi import FastAPI, HTTPException
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+import orjson
+from pydantic import BaseModel, Field, PlainValidator
+from typing import Annotated, List, Literal, Optional
 from bson import ObjectId
 
-from database import db, create_document, get_documents
-from schemas import Menuitem, Order, Orderitem, Customer
+import database
+from database import db, create_document, create_documents
+from schemas import Menuitem, Customer
 
-app = FastAPI(title="Canteen Management API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if db is not None:
+        # Warm the connection pool before Uvicorn starts serving traffic
+        await database.ping()
+        # Keep the hot-path filters (order.status, menuitem.is_available) on index seeks
+        await db["order"].create_index("status")
+        await db["menuitem"].create_index("is_available")
+    yield
+    database.close()
+
+
+app = FastAPI(title="Canteen Management API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=[os.getenv("FRONTEND_ORIGIN", "http://localhost:3000")],
     allow_credentials=True,
-    allow_methods=["*"],
+    allow_methods=["GET", "POST", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
 )
 
 
+# Env flags for the /test diagnostics endpoint; these never change at runtime
+_HAS_DB_URL = bool(os.getenv("DATABASE_URL"))
+_HAS_DB_NAME = bool(os.getenv("DATABASE_NAME"))
+
+
 # Helpers
 class IDModel(BaseModel):
     id: str
 
 
+def _validate_object_id(v) -> ObjectId:
+    if isinstance(v, ObjectId):
+        return v
+    # is_valid is a cheap C-level check; avoids exception setup/teardown on bad ids
+    if not ObjectId.is_valid(v):
+        raise ValueError("Invalid id")
+    return ObjectId(v)
+
+
+# Validates ids in Pydantic's core. Body models only: FastAPI 0.104 rebuilds
+# path/query params from the bare type and drops the PlainValidator, leaving a
+# raw ObjectId it cannot schema-generate.
+PyObjectId = Annotated[ObjectId, PlainValidator(_validate_object_id)]
+
+
 def object_id(id_str: str) -> ObjectId:
-    try:
-        return ObjectId(id_str)
-    except Exception:
+    if not ObjectId.is_valid(id_str):
         raise HTTPException(status_code=400, detail="Invalid id")
+    return ObjectId(id_str)
 
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Canteen Management Backend is running"}
 
 
 # Menu endpoints
+# The menu changes rarely, so list_menu serves from a short-lived in-process
+# cache that menu mutations invalidate.
+MENU_CACHE_TTL = 30.0
+_menu_cache = {"data": None, "ts": 0.0}
+
+
+def _invalidate_menu_cache():
+    _menu_cache["ts"] = 0.0
+
+
 @app.post("/api/menu", response_model=dict)
-def add_menu_item(item: Menuitem):
-    inserted_id = create_document("menuitem", item)
+async def add_menu_item(item: Menuitem):
+    inserted_id = await create_document("menuitem", item)
+    _invalidate_menu_cache()
     return {"id": inserted_id}
 
 
+@app.post("/api/menu/bulk", response_model=dict)
+async def add_menu_items(items: Annotated[List[Menuitem], Field(min_length=1)]):
+    inserted_ids = await create_documents("menuitem", items)
+    _invalidate_menu_cache()
+    return {"ids": inserted_ids}
+
+
 @app.get("/api/menu")
-def list_menu():
-    items = get_documents("menuitem")
-    # Convert ObjectId to string
-    for it in items:
-        it["_id"] = str(it["_id"])
-    return {"items": items}
+async def list_menu(limit: int = Query(50, ge=1, le=500), after: Optional[str] = None):
+    # Only the default first page is cached
+    cacheable = limit == 50 and after is None
+    if cacheable and _menu_cache["data"] is not None and time.monotonic() - _menu_cache["ts"] < MENU_CACHE_TTL:
+        return Response(content=_menu_cache["data"], media_type="application/json")
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not available")
+    # $toString converts _id server-side, so no Python rewrite loop is needed
+    pipeline = [
+        {"$match": {"_id": {"$gt": object_id(after)}} if after else {}},
+        {"$sort": {"_id": 1}},
+        {"$limit": limit},
+        {"$addFields": {"_id": {"$toString": "$_id"}}},
+    ]
+    # Serialize one document at a time off the cursor and cache the bytes
+    parts = [b'{"items":[']
+    first = True
+    async for it in db["menuitem"].aggregate(pipeline):
+        parts.append((b"" if first else b",") + orjson.dumps(it))
+        first = False
+    parts.append(b"]}")
+    data = b"".join(parts)
+    if cacheable:
+        _menu_cache["data"] = data
+        _menu_cache["ts"] = time.monotonic()
+    return Response(content=data, media_type="application/json")
 
 
 @app.patch("/api/menu/{item_id}")
-def update_menu_item(item_id: str, payload: dict):
+async def update_menu_item(item_id: str, payload: dict):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available")
-    res = db["menuitem"].update_one({"_id": object_id(item_id)}, {"$set": payload})
+    res = await db["menuitem"].update_one({"_id": object_id(item_id)}, {"$set": payload})
     if res.matched_count == 0:
         raise HTTPException(status_code=404, detail="Item not found")
+    _invalidate_menu_cache()
     return {"updated": True}
 
 
 @app.delete("/api/menu/{item_id}")
-def delete_menu_item(item_id: str):
+async def delete_menu_item(item_id: str):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available")
-    res = db["menuitem"].delete_one({"_id": object_id(item_id)})
+    res = await db["menuitem"].delete_one({"_id": object_id(item_id)})
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Item not found")
+    _invalidate_menu_cache()
     return {"deleted": True}
 
 
 # Orders endpoints
+class OrderLine(BaseModel):
+    menu_item_id: PyObjectId
+    quantity: int = Field(1, ge=1)
+
+
 class CreateOrder(BaseModel):
     customer_name: str
     table_number: Optional[str] = None
-    items: List[dict]  # expects: [{menu_item_id, quantity}]
+    items: List[OrderLine]
 
 
 @app.post("/api/orders")
-def create_order(payload: CreateOrder):
+async def create_order(payload: CreateOrder):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available")
 
-    order_items: List[Orderitem] = []
-    subtotal = 0.0
+    # Resolve prices, line totals and the subtotal server-side in one round-trip:
+    # feed the requested lines through $documents, join the menu with $lookup,
+    # and let MongoDB do the arithmetic.
+    pipeline = [
+        {"$documents": [{"menu_item_id": i.menu_item_id, "quantity": i.quantity} for i in payload.items]},
+        {"$lookup": {"from": "menuitem", "localField": "menu_item_id", "foreignField": "_id", "as": "m"}},
+        {"$unwind": "$m"},
+        {"$match": {"m.is_available": True}},
+        {"$set": {"line_total": {"$multiply": ["$quantity", "$m.price"]}}},
+        {"$group": {
+            "_id": None,
+            "items": {"$push": {
+                "menu_item_id": {"$toString": "$menu_item_id"},
+                "name": "$m.name",
+                "price": "$m.price",
+                "quantity": "$quantity",
+                "line_total": "$line_total",
+            }},
+            "subtotal": {"$sum": "$line_total"},
+        }},
+    ]
+    rows = await db.aggregate(pipeline).to_list(length=1)
+    row = rows[0] if rows else {"items": [], "subtotal": 0}
+
+    if len(row["items"]) != len(payload.items):
+        found = {it["menu_item_id"] for it in row["items"]}
+        for i in payload.items:
+            if str(i.menu_item_id) not in found:
+                raise HTTPException(status_code=400, detail=f"Menu item {i.menu_item_id} unavailable")
+
+    # Integer-cents arithmetic: no float accumulation, no round() calls
+    subtotal_cents = round(float(row["subtotal"]) * 100)
+    # round half up; intentionally diverges from the old round(subtotal * 0.05, 2),
+    # which banker's-rounds a floating-point product
+    tax_cents = (subtotal_cents * 5 + 50) // 100
+    total_cents = subtotal_cents + tax_cents
+    subtotal = subtotal_cents / 100
+    tax = tax_cents / 100
+    total = total_cents / 100
+
+    # The line items came straight out of the aggregation, so skip re-validating
+    # them through Orderitem/Order and write the document directly
+    order_doc = {
+        "customer_name": payload.customer_name,
+        "table_number": payload.table_number,
+        "items": row["items"],
+        "subtotal": subtotal,
+        "tax": tax,
+        "total": total,
+        "status": "pending",
+    }
+    order_id = await create_document("order", order_doc)
+    return {"id": order_id, "subtotal": subtotal, "tax": tax, "total": total}
+
 
-    for i in payload.items:
-        mid = i.get("menu_item_id")
-        qty = int(i.get("quantity", 1))
-        doc = db["menuitem"].find_one({"_id": object_id(mid), "is_available": True})
-        if not doc:
-            raise HTTPException(status_code=400, detail=f"Menu item {mid} unavailable")
-        price = float(doc.get("price", 0))
-        name = doc.get("name")
-        line_total = price * qty
-        subtotal += line_total
-        order_items.append(Orderitem(menu_item_id=str(doc["_id"]), name=name, price=price, quantity=qty, line_total=line_total))
+@app.get("/api/orders")
+async def list_orders(limit: int = Query(50, ge=1, le=500), after: Optional[str] = None, summary: bool = False):
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not available")
+    # _id-based cursor pagination avoids skip()'s O(N) scan
+    pipeline = [
+        {"$match": {"_id": {"$gt": object_id(after)}} if after else {}},
+        {"$sort": {"_id": 1}},
+        {"$limit": limit},
+    ]
+    if summary:
+        # summary=true skips the embedded items for list views that only show totals
+        pipeline.append({"$project": {"customer_name": 1, "total": 1, "status": 1, "table_number": 1}})
+    # $toString converts _id server-side, so no Python rewrite loop is needed
+    pipeline.append({"$addFields": {"_id": {"$toString": "$_id"}}})
 
-    tax = round(subtotal * 0.05, 2)
-    total = round(subtotal + tax, 2)
+    async def gen():
+        yield b'{"orders":['
+        first = True
+        async for o in db["order"].aggregate(pipeline):
+            yield (b"" if first else b",") + orjson.dumps(o)
+            first = False
+        yield b"]}"
 
-    order_doc = Order(customer_name=payload.customer_name, table_number=payload.table_number, items=order_items, subtotal=round(subtotal, 2), tax=tax, total=total)
-    order_id = create_document("order", order_doc)
-    return {"id": order_id, "subtotal": order_doc.subtotal, "tax": order_doc.tax, "total": order_doc.total}
+    return StreamingResponse(gen(), media_type="application/json")
 
 
-@app.get("/api/orders")
-def list_orders():
-    orders = get_documents("order")
-    for o in orders:
-        o["_id"] = str(o["_id"])
-    return {"orders": orders}
+class StatusPatch(BaseModel):
+    status: Literal["pending", "preparing", "ready", "completed", "cancelled"]
 
 
 @app.patch("/api/orders/{order_id}")
-def update_order_status(order_id: str, payload: dict):
+async def update_order_status(order_id: str, payload: StatusPatch):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available")
-    status = payload.get("status")
-    if status not in ["pending", "preparing", "ready", "completed", "cancelled"]:
-        raise HTTPException(status_code=400, detail="Invalid status")
-    res = db["order"].update_one({"_id": object_id(order_id)}, {"$set": {"status": status}})
+    res = await db["order"].update_one({"_id": object_id(order_id)}, {"$set": {"status": payload.status}})
     if res.matched_count == 0:
         raise HTTPException(status_code=404, detail="Order not found")
     return {"updated": True}
@@ -130,17 +264,26 @@ def update_order_status(order_id: str, payload: dict):
 
 # Simple dashboard metrics
 @app.get("/api/metrics")
-def metrics():
+async def metrics():
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available")
-    total_menu = db["menuitem"].count_documents({})
-    pending_orders = db["order"].count_documents({"status": {"$in": ["pending", "preparing"]}})
-    completed_today = db["order"].count_documents({"status": "completed"})
+    # Single pass over the order collection for both counts, concurrent with the menu count
+    order_agg = db["order"].aggregate([
+        {"$match": {"status": {"$in": ["pending", "preparing", "completed"]}}},
+        {"$group": {"_id": "$status", "n": {"$sum": 1}}},
+    ])
+    total_menu, status_counts = await asyncio.gather(
+        db["menuitem"].count_documents({}),
+        order_agg.to_list(length=None),
+    )
+    by_status = {g["_id"]: g["n"] for g in status_counts}
+    pending_orders = by_status.get("pending", 0) + by_status.get("preparing", 0)
+    completed_today = by_status.get("completed", 0)
     return {"total_menu": total_menu, "active_orders": pending_orders, "completed_orders": completed_today}
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -158,7 +301,7 @@ def test_database():
             response["connection_status"] = "Connected"
 
             try:
-                collections = db.list_collection_names()
+                collections = await db.list_collection_names()
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -169,9 +312,8 @@ def test_database():
     except Exception as e:
         response["database"] = f"❌ Error: {str(e)[:50]}"
 
-    import os
-    response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
-    response["database_name"] = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
+    response["database_url"] = "✅ Set" if _HAS_DB_URL else "❌ Not Set"
+    response["database_name"] = "✅ Set" if _HAS_DB_NAME else "❌ Not Set"
 
     return response
 
@@ -179,4 +321,11 @@ def test_database():
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count())),
+    )